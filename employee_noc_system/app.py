@@ -1,58 +1,269 @@
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash
+from flask import Flask, render_template, request, url_for, send_from_directory, jsonify, Response, abort, \
+    stream_with_context
+import atexit
+import csv
+import io
+import itertools
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import safe_join
 from noc_generator import EmployeeNOCGenerator
 
 app = Flask(__name__)
-app.secret_key = "super_secret_key"
 
 # Config
 TEMPLATE_PATH = "NDA-1.docx"            # Ensure this file exists in project root (or set absolute path)
 OUTPUT_FOLDER = "generated_noc"
 PORT = 5001
+MAX_FIELD_LENGTH = 100                  # longest accepted Full Name / Job Title / Department
+MAX_BATCH_ROWS = 500                    # most employees accepted in one CSV upload
+MAX_UPLOAD_BYTES = 1024 * 1024          # largest accepted request body (the CSV upload)
+# Background threads that generate NOCs; generation is short and mostly CPU-bound
+THREADS = os.cpu_count() or 4
+# waitress request threads. Each open /progress stream holds one for up to SSE_MAX_STREAM seconds,
+# so this is sized for concurrent streams on top of ordinary requests, independently of THREADS
+SERVER_THREADS = THREADS + 32
+JOB_TTL = 600                           # seconds a finished job's events are kept if nobody collects them
+SSE_KEEPALIVE = 15                      # seconds between keep-alive comments on an idle /progress stream
+SSE_MAX_STREAM = 60                     # seconds before /progress hands its thread back (the browser reconnects)
 
-# Ensure folders exist
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+# Logging goes through a queue so request threads never block on console I/O;
+# a listener thread does the actual writes
+_log_queue = queue.Queue(-1)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(_log_queue))
+logging.getLogger().setLevel(logging.INFO)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logger = logging.getLogger(__name__)
+
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 
 # Create a single generator instance (or create per-request)
 try:
-    generator = EmployeeNOCGenerator(TEMPLATE_PATH)
-except Exception as e:
+    # also creates OUTPUT_FOLDER
+    generator = EmployeeNOCGenerator(TEMPLATE_PATH, default_output_dir=OUTPUT_FOLDER)
+except Exception:
     # If you run app before placing the template, this informs you
-    print(f"Error initializing NOC generator: {e}")
+    logger.exception("Error initializing NOC generator")
     raise
 
+# Cached /results listing: (output folder mtime, files newest first). Rebuilt only when the folder changes.
+_results_cache = None
+_results_lock = threading.Lock()
+
+def _list_results():
+    global _results_cache
+    dir_mtime = os.stat(OUTPUT_FOLDER).st_mtime_ns
+    with _results_lock:
+        if _results_cache is not None and _results_cache[0] == dir_mtime:
+            return _results_cache[1]
+        # single directory pass instead of listdir + a getmtime per file
+        with os.scandir(OUTPUT_FOLDER) as it:
+            entries = [(e.name, e.stat().st_mtime) for e in it if e.is_file() and e.name.lower().endswith(".docx")]
+        # sort files by modification time descending
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        files = [name for name, _ in entries]
+        _results_cache = (dir_mtime, files)
+        return files
+
+def _invalidate_results_cache():
+    global _results_cache
+    with _results_lock:
+        _results_cache = None
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify(error=f"The upload is larger than {MAX_UPLOAD_BYTES // 1024} KB."), 413
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
+def _validate_fields(full_name, job_title, department):
+    """Return an error message for invalid form values, or None. Runs before any generation work."""
+    if not full_name or not job_title or not department:
+        return "Please fill all fields: Full Name, Job Title, Department."
+    if max(len(full_name), len(job_title), len(department)) > MAX_FIELD_LENGTH:
+        return f"Fields must be at most {MAX_FIELD_LENGTH} characters."
+    return None
+
+class _Job:
+    """Progress events of one background job; `finished_at` is set once its final event is queued."""
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.finished_at = None
+
+    def put(self, event):
+        self.events.put(event)
+
+    def finish(self, event):
+        self.events.put(event)
+        self.finished_at = time.monotonic()
+
+# Background NOC jobs: job id -> _Job, drained by /progress/<job_id>
+jobs = {}
+_jobs_lock = threading.Lock()
+# Fixed pool of long-lived workers: caps concurrent generations and lets each worker thread keep
+# its warmed template Document between jobs
+_workers = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="noc-worker")
+
+def _prune_jobs():
+    """Drop finished jobs whose events were never collected (e.g. the client never opened /progress)."""
+    cutoff = time.monotonic() - JOB_TTL
+    with _jobs_lock:
+        for job_id in [k for k, job in jobs.items() if job.finished_at is not None and job.finished_at < cutoff]:
+            del jobs[job_id]
+
+def _submit_job(fn, *args):
+    """Register a job, queue `fn(job, *args)` on the worker pool and return the job id."""
+    _prune_jobs()
+    job_id = uuid.uuid4().hex
+    job = _Job()
+    with _jobs_lock:
+        jobs[job_id] = job
+    _workers.submit(fn, job, *args)
+    return job_id
+
+def _run_noc(job, full_name, job_title, department):
+    try:
+        out_path = generator.generate_noc(full_name, job_title, department, output_dir=OUTPUT_FOLDER,
+                                          progress=lambda stage: job.put({"stage": stage}))
+        # regenerating an existing name may not bump the folder mtime on every filesystem
+        _invalidate_results_cache()
+        job.finish({"stage": "done", "message": f"NOC generated for {full_name}",
+                    "filename": os.path.basename(out_path)})
+    except Exception as e:
+        job.finish({"stage": "error", "message": f"Error generating NOC: {e}"})
+
 @app.route("/generate", methods=["POST"])
 def generate():
     full_name = request.form.get("full_name", "").strip()
     job_title = request.form.get("job_title", "").strip()
     department = request.form.get("department", "").strip()
 
-    if not full_name or not job_title or not department:
-        flash("Please fill all fields: Full Name, Job Title, Department.")
-        return redirect(url_for("index"))
+    error = _validate_fields(full_name, job_title, department)
+    if error:
+        return jsonify(error=error), 400
+
+    # Generate in the background and return at once; the client follows progress over /progress/<job_id>
+    job_id = _submit_job(_run_noc, full_name, job_title, department)
+    return jsonify(job_id=job_id, progress_url=url_for("progress", job_id=job_id)), 202
 
+def _run_batch(job, rows):
     try:
-        out_path = generator.generate_noc(full_name, job_title, department, output_dir=OUTPUT_FOLDER)
-        flash(f"NOC generated for {full_name}")
-        return redirect(url_for("results"))
+        paths = generator.generate_noc_many(rows, output_dir=OUTPUT_FOLDER,
+                                            progress=lambda stage: job.put({"stage": stage}))
+        _invalidate_results_cache()
+        job.finish({"stage": "done", "message": f"{len(set(paths))} NOCs generated"})
     except Exception as e:
-        flash(f"Error generating NOC: {e}")
-        return redirect(url_for("index"))
+        _invalidate_results_cache()
+        job.finish({"stage": "error", "message": f"Error generating NOCs: {e}"})
+
+@app.route("/generate_batch", methods=["POST"])
+def generate_batch():
+    upload = request.files.get("csv_file")
+    if upload is None or not upload.filename:
+        return jsonify(error="Please choose a CSV file."), 400
+
+    # Expected columns: Full Name, Job Title, Department (header spelling/case is flexible)
+    reader = csv.DictReader(io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline=""))
+    try:
+        # read one row past the cap so an oversized file is rejected without parsing all of it
+        rows = [
+            {k.strip().lower().replace(" ", "_"): (v or "").strip() for k, v in record.items() if k is not None}
+            for record in itertools.islice(reader, MAX_BATCH_ROWS + 1)
+        ]
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify(error=f"Could not read CSV: {e}"), 400
+    if not rows:
+        return jsonify(error="The CSV file has no rows."), 400
+    if len(rows) > MAX_BATCH_ROWS:
+        return jsonify(error=f"The CSV file has more than {MAX_BATCH_ROWS} rows."), 400
+    # Rows are numbered from 1 (the first row after the header), as in generate_noc_many's errors.
+    # Names whose file stems differ only in case would overwrite each other on Windows/macOS.
+    stem_rows = {}
+    for row_no, row in enumerate(rows, start=1):
+        error = _validate_fields(row.get("full_name"), row.get("job_title"), row.get("department"))
+        if error:
+            return jsonify(error=f"Row {row_no}: {error}"), 400
+        stem = generator.safe_name(row["full_name"])
+        if stem.casefold() in stem_rows:
+            return jsonify(error=f"Rows {stem_rows[stem.casefold()]} and {row_no} would both be saved as "
+                                 f"NOC_{stem}.docx; please make the names distinct."), 400
+        stem_rows[stem.casefold()] = row_no
+
+    job_id = _submit_job(_run_batch, rows)
+    return jsonify(job_id=job_id, progress_url=url_for("progress", job_id=job_id)), 202
+
+@app.route("/progress/<job_id>")
+def progress(job_id):
+    with _jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+
+    def stream():
+        # The job is dropped when its final event is sent or the client goes away; it is only kept when
+        # this stream ends itself after SSE_MAX_STREAM so that a waitress thread isn't held indefinitely
+        resumable = False
+        deadline = time.monotonic() + SSE_MAX_STREAM
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    event = job.events.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    # SSE comment: keeps proxies from timing out and surfaces disconnected clients
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["stage"] == "done":
+                    if "filename" in event:
+                        event["download_url"] = url_for("download", filename=event["filename"])
+                    event["results_url"] = url_for("results")
+                yield f"data: {json.dumps(event)}\n\n"
+                if event["stage"] in ("done", "error"):
+                    return
+            resumable = True
+            # EventSource reconnects after `retry` ms and continues reading the same queue
+            yield "retry: 1000\n\n"
+        finally:
+            if not resumable:
+                with _jobs_lock:
+                    jobs.pop(job_id, None)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
 
 @app.route("/results")
 def results():
-    files = [f for f in os.listdir(OUTPUT_FOLDER) if f.lower().endswith(".docx")]
-    # sort files by modification time descending
-    files = sorted(files, key=lambda f: os.path.getmtime(os.path.join(OUTPUT_FOLDER, f)), reverse=True)
+    files = _list_results()
     return render_template("results.html", files=files)
 
 @app.route("/download/<filename>")
 def download(filename):
-    return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True)
+    path = safe_join(OUTPUT_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    # ETag from size + mtime lets repeat downloads get a 304 without reading or sending the file.
+    # The response stays "no-cache" (revalidate every time) because a NOC can be regenerated under the same name.
+    st = os.stat(path)
+    return send_from_directory(OUTPUT_FOLDER, filename, as_attachment=True, conditional=True,
+                               etag=f"{st.st_size}-{st.st_mtime_ns}", last_modified=st.st_mtime)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=PORT, debug=True)
+    if os.environ.get("FLASK_DEBUG") == "1":
+        # Development only: reloader + debugger, single process
+        app.run(host="0.0.0.0", port=PORT, debug=True)
+    else:
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=PORT, threads=SERVER_THREADS)
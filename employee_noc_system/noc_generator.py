@@ -1,6 +1,37 @@
+import bisect
+import copy
+import hashlib
+import io
+import itertools
+import logging
 import os
 import re
+import tempfile
+import threading
+import unicodedata
+import zipfile
+from typing import Callable, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape as xml_escape
 from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+
+class _Slot(NamedTuple):
+    """A template paragraph known to contain labels, recorded once when the template is loaded."""
+    kind: str               # "para" for a top-level paragraph, "table" for a paragraph inside a table cell
+    path: Tuple[int, ...]   # (para,) or (table, row, cell, para) indices to find it again in a fresh Document
+    keys: Tuple[str, ...]   # labels found in that paragraph, in document order
+
+
+DOCUMENT_PART = "word/document.xml"
+
+logger = logging.getLogger(__name__)
+
+# Process umask, read once at import (os.umask can only be read by setting it, which is not thread-safe)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 
 class EmployeeNOCGenerator:
     """
@@ -12,10 +43,148 @@ class EmployeeNOCGenerator:
     e.g. "Full Name: Arjun Kumar".
     """
 
-    def __init__(self, template_path: str):
+    FIELD_LABELS = ("Full Name", "Job Title", "Department")
+
+    def __init__(self, template_path: str, default_output_dir: str = "generated_noc"):
         if not os.path.exists(template_path):
             raise FileNotFoundError(f"Template not found: {template_path}")
         self.template_path = template_path
+        # Create the output directory once here; generate_noc only checks directories it hasn't seen yet
+        self.default_output_dir = default_output_dir
+        os.makedirs(default_output_dir, exist_ok=True)
+        self._ready_dirs = {default_output_dir}
+        # Read the template once; worker Documents and the byte-level fast path are built from these
+        # bytes instead of reopening and re-reading the file from disk.
+        with open(template_path, "rb") as f:
+            self._template_bytes = f.read()
+
+        # Compile the label patterns once instead of once per paragraph per request
+        self._label_patterns = {
+            key: re.compile(rf'\b{re.escape(key)}\b\s*:', re.IGNORECASE) for key in self.FIELD_LABELS
+        }
+        self._value_patterns = {
+            key: re.compile(rf'({re.escape(key)})\s*:\s*([^\n]*)', re.IGNORECASE) for key in self.FIELD_LABELS
+        }
+        self._unsafe_run_re = re.compile('\0+')
+        self._blank_wt_re = re.compile(rb'<w:t(?:\s[^>]*)?>[ \t]*</w:t>')
+        self._control_char_re = re.compile(r'[\x00-\x1f\x7f\ud800-\udfff\ufffe\uffff]')
+
+        # One case-insensitive pattern for all labels so each paragraph is scanned once;
+        # the named group that matched tells us which label was found.
+        self._group_labels = {key.replace(" ", ""): key for key in self.FIELD_LABELS}
+        alternatives = "|".join(
+            rf'(?P<{group}>{re.escape(key)})' for group, key in self._group_labels.items()
+        )
+        self._combined_label_re = re.compile(rf'\b(?:{alternatives})\b\s*:', re.IGNORECASE)
+
+        # Tokenize the template once: remember which paragraphs hold labels so requests only visit those.
+        # This also parses the template up front, so a corrupt file fails at startup.
+        template_doc = Document(io.BytesIO(self._template_bytes))
+        self._slots = []
+        slot_texts = []
+        for p_idx, para in enumerate(template_doc.paragraphs):
+            keys = self._labels_in(para.text)
+            if keys:
+                self._slots.append(_Slot("para", (p_idx,), keys))
+                slot_texts.append(para.text)
+        # Flatten table cells the same way so requests never walk tables/rows/cells themselves
+        for t_idx, table in enumerate(template_doc.tables):
+            # skip the row/cell walk for tables whose text holds no label at all; paragraphs are joined with
+            # newlines so text from neighbouring cells can't run together and hide a label
+            table_text = "\n".join(Paragraph(p, table).text for p in table._tbl.iter(qn("w:p")))
+            if not self._combined_label_re.search(table_text):
+                continue
+            seen_cells = set()
+            for r_idx, row in enumerate(table.rows):
+                for c_idx, cell in enumerate(row.cells):
+                    # merged cells are returned once per grid column; only record the first occurrence
+                    if cell._tc in seen_cells:
+                        continue
+                    seen_cells.add(cell._tc)
+                    for p_idx, para in enumerate(cell.paragraphs):
+                        keys = self._labels_in(para.text)
+                        if keys:
+                            self._slots.append(_Slot("table", (t_idx, r_idx, c_idx, p_idx), keys))
+                            slot_texts.append(para.text)
+        self._has_para_slots = any(slot.kind == "para" for slot in self._slots)
+        self._has_table_slots = any(slot.kind == "table" for slot in self._slots)
+
+        # Per-thread warmed Document (see _worker_document)
+        self._local = threading.local()
+
+        # Fast path: when every label sits alone in its own <w:t> element, fill the form by substituting
+        # bytes in word/document.xml and re-zipping, without going through python-docx at all.
+        # Every other part is compressed once here into a base archive; a request only appends document.xml.
+        base = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(self._template_bytes)) as zi, zipfile.ZipFile(base, "w") as zo:
+            for info in zi.infolist():
+                if info.filename == DOCUMENT_PART:
+                    self._doc_info = info
+                    self._doc_xml = zi.read(info)
+                else:
+                    zo.writestr(info, zi.read(info), compress_type=info.compress_type)
+        self._base_zip = base.getvalue()
+        self._xml_label_patterns = self._build_xml_label_patterns(slot_texts)
+        if self._xml_label_patterns is not None and not self._fast_path_agrees():
+            self._xml_label_patterns = None
+
+    def _build_xml_label_patterns(self, slot_texts: list):
+        """
+        Return {label: pattern matching the label's whole <w:t> element in document.xml, plus any
+        blank-only <w:t> runs right after it}, or None when the template does not allow byte-level
+        substitution. It is allowed only if the result matches the run-based path: each label appears at
+        most once per paragraph, only blanks follow it up to the end of its line, and each label found in
+        the text is exactly one "<w:t>Label:</w:t>" in the XML.
+        """
+        text_counts = dict.fromkeys(self.FIELD_LABELS, 0)
+        for text in slot_texts:
+            for m in self._combined_label_re.finditer(text):
+                line_end = text.find('\n', m.end())
+                if text[m.end():line_end if line_end != -1 else len(text)].strip():
+                    return None
+                text_counts[self._group_labels[m.lastgroup]] += 1
+        patterns = {}
+        for key in self.FIELD_LABELS:
+            pattern = re.compile(
+                rb'<w:t(?:\s[^>]*)?>(' + re.escape(key.encode("utf-8")) + rb'\s*:)(\s*)</w:t>'
+                rb'((?:</w:r><w:r(?:\s[^>]*)?>(?:<w:rPr>.*?</w:rPr>)?<w:t(?:\s[^>]*)?>[ \t]*</w:t>)*)',
+                re.IGNORECASE | re.DOTALL
+            )
+            xml_count = len(pattern.findall(self._doc_xml))
+            slot_count = sum(key in slot.keys for slot in self._slots)
+            if xml_count != text_counts[key] or text_counts[key] != slot_count:
+                return None
+            if xml_count:
+                patterns[key] = pattern
+        return patterns
+
+    def _fast_path_agrees(self) -> bool:
+        """
+        Render probe values through both paths and check the filled paragraphs have the same text in the
+        same runs, so the value also picks up the same run formatting (e.g. a bold label, plain value).
+        """
+        probe = {key: f"Probe {key}" for key in self.FIELD_LABELS}
+        fast = [[r.text for r in p.runs] for p in self._resolve_slots(Document(self._render_xml(probe)))]
+        slow = [[r.text for r in p.runs] for p in self._resolve_slots(Document(self._render_document(probe)))]
+        return fast == slow
+
+    def safe_name(self, full_name: str) -> str:
+        """
+        Return the filesystem-safe form of `full_name` used in the output file name. Names made only of
+        letters, combining marks, digits (any script), ".", "-" and "_" are used as is ("李雷" -> "李雷"). Anything else is
+        replaced by "_" and a short hash of the full name is appended ("Arjun Kumar" -> "Arjun_Kumar_<hash>"),
+        so two names that sanitize alike ("A B" / "A_B") never share a file, while the same name always
+        maps to the same file.
+        """
+        name = full_name.strip()
+        if not name:
+            return "unknown"
+        marked = "".join(c if c in "._-" or unicodedata.category(c)[0] in "LMN" else "\0" for c in name)
+        safe = self._unsafe_run_re.sub('_', marked)
+        if safe == name:
+            return safe
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+        return f"{safe.strip('_') or 'name'}_{digest}"
 
     def _replace_fields_in_text(self, text: str, replacements: dict) -> str:
         """
@@ -25,119 +194,264 @@ class EmployeeNOCGenerator:
         """
         updated = text
         for key, value in replacements.items():
-            pattern = re.compile(rf'({re.escape(key)})\s*:\s*([^\n]*)', re.IGNORECASE)
-            updated = pattern.sub(lambda m: f"{m.group(1)}: {value}", updated)
+            updated = self._value_patterns[key].sub(lambda m: f"{m.group(1)}: {value}", updated)
         return updated
 
     def _find_label_match(self, text: str, key: str):
         """Return a regex match for the label (e.g. 'Job Title:') in text, or None."""
-        pattern = re.compile(rf'\b{re.escape(key)}\b\s*:', re.IGNORECASE)
-        return pattern.search(text)
+        return self._label_patterns[key].search(text)
 
-    def _replace_field_in_paragraph_runs(self, para, key: str, value: str) -> bool:
+    def _replace_field_in_paragraph_runs(self, para, key: str, value: str, runs: list, run_texts: list) -> bool:
         """
         Replace only the value for a given label inside a paragraph while preserving run objects.
         This replaces text after the label's colon up to the next newline (so later placeholders on
-        subsequent lines are preserved).
+        subsequent lines are preserved). Only the runs overlapping that span are rewritten.
+        `runs` and `run_texts` are the paragraph's runs and their texts, read once by the caller;
+        `run_texts` is updated in place for every run that is rewritten.
         Returns True if a replacement was made.
         """
-        full_text = para.text
+        # If there are no runs, fallback to para.text assignment
+        if not runs:
+            full_text = para.text
+            match = self._find_label_match(full_text, key)
+            if not match:
+                return False
+            next_nl = full_text.find('\n', match.end())
+            rest = full_text[next_nl:] if next_nl != -1 else ""
+            para.text = f"{full_text[:match.end()]} {value}{rest}"
+            return True
+
+        full_text = "".join(run_texts)
         match = self._find_label_match(full_text, key)
         if not match:
             return False
 
+        def set_run(i: int, text: str) -> None:
+            runs[i].text = text
+            run_texts[i] = text
+
         label_end = match.end()  # index right after the colon
         # find end of current line (next newline) to avoid touching following placeholders
-        next_nl = full_text.find('\n', label_end)
-        if next_nl == -1:
-            rest = full_text[label_end:]  # no newline, keep whatever follows
-        else:
-            rest = full_text[next_nl:]   # include newline and everything after it
-
-        # Build the desired paragraph text: original upto label_end + space + value + rest
-        left_part = full_text[:label_end]
-        desired_text = f"{left_part} {value}{rest}"
-
-        # Write desired_text back into runs, preserving run objects (and inline drawings)
-        cum_len = 0
-        runs = para.runs
-        # If there are no runs, fallback to para.text assignment
-        if not runs:
-            para.text = desired_text
+        line_end = full_text.find('\n', label_end)
+        if line_end == -1:
+            line_end = len(full_text)
+
+        # run_ends[i] is the offset just past run i, so bisect_right finds the run holding a given offset
+        run_ends = list(itertools.accumulate(len(t) for t in run_texts))
+        first = bisect.bisect_right(run_ends, label_end)
+        if first == len(runs):
+            # label is at the very end of the paragraph: append the value to the last run
+            set_run(len(runs) - 1, f"{run_texts[-1]} {value}")
             return True
+        last = bisect.bisect_right(run_ends, line_end) if line_end < len(full_text) else len(runs) - 1
 
-        # original run text lengths (to map slices)
-        orig_run_texts = [r.text or "" for r in runs]
-        orig_lengths = [len(t) for t in orig_run_texts]
-        total_orig_len = sum(orig_lengths)
-
-        # Overwrite runs slice-by-slice using original run lengths so run objects remain
-        pos = 0
-        for i, run in enumerate(runs):
-            slot_len = orig_lengths[i]
-            if pos >= len(desired_text):
-                # no characters remain for this run
-                if run.text != "":
-                    run.text = ""
-            else:
-                end = min(pos + slot_len, len(desired_text))
-                run_slice = desired_text[pos:end]
-                run.text = run_slice
-            pos += slot_len
+        first_start = run_ends[first] - len(run_texts[first])
+        head = f"{run_texts[first][:label_end - first_start]} {value}"
+        if first == last:
+            set_run(first, head + run_texts[first][line_end - first_start:])
+            return True
 
-        # If desired_text has extra characters beyond combined original run text, append to the last run
-        if len(desired_text) > total_orig_len:
-            extra = desired_text[total_orig_len:]
-            runs[-1].text = (runs[-1].text or "") + extra
+        set_run(first, head)
+        for i in range(first + 1, last):
+            if run_texts[i]:
+                set_run(i, "")
+        last_start = run_ends[last] - len(run_texts[last])
+        tail = run_texts[last][line_end - last_start:]
+        if tail != run_texts[last]:
+            set_run(last, tail)
 
         return True
 
-    def generate_noc(self, full_name: str, job_title: str, department: str, output_dir: str = "generated_noc") -> str:
+    def _labels_in(self, text: str) -> tuple:
+        """Return the labels found in `text` (each once, in order) using a single combined-pattern scan."""
+        return tuple(dict.fromkeys(
+            self._group_labels[m.lastgroup] for m in self._combined_label_re.finditer(text)
+        ))
+
+    def _fill_paragraph(self, para, replacements: dict, keys: tuple) -> None:
+        """
+        Replace the value of every label in `keys` (found in `para` by the template scan). The runs and
+        their text are read from the XML once and shared by all labels in the paragraph.
+        """
+        runs = para.runs
+        run_texts = [r.text or "" for r in runs]
+        for key in keys:
+            value = replacements[key]
+            replaced = self._replace_field_in_paragraph_runs(para, key, value, runs, run_texts)
+            if not replaced:
+                # fallback: full-text replace (should be rare); para.text rebuilds the runs
+                para.text = self._replace_fields_in_text(para.text, {key: value})
+                runs = para.runs
+                run_texts = [r.text or "" for r in runs]
+            elif not runs:
+                runs = para.runs
+                run_texts = [r.text or "" for r in runs]
+
+    def _resolve_slots(self, doc) -> list:
+        """Return the paragraph objects in `doc` for each recorded slot, in slot order."""
+        # only build the paragraph/table lists the slots actually need
+        paragraphs = doc.paragraphs if self._has_para_slots else []
+        tables = doc.tables if self._has_table_slots else []
+        resolved = []
+        for slot in self._slots:
+            if slot.kind == "para":
+                resolved.append(paragraphs[slot.path[0]])
+            else:
+                t_idx, r_idx, c_idx, p_idx = slot.path
+                resolved.append(tables[t_idx].rows[r_idx].cells[c_idx].paragraphs[p_idx])
+        return resolved
+
+    def _worker_document(self):
+        """
+        Return this thread's reusable (doc, slot paragraphs, snapshot), parsing the template on first use.
+        The snapshot holds copies of each slot paragraph's original XML children so the document can be
+        put back into its template state after every render instead of being re-parsed.
+        """
+        state = getattr(self._local, "state", None)
+        if state is None:
+            doc = Document(io.BytesIO(self._template_bytes))
+            paras = self._resolve_slots(doc)
+            snapshot = [[copy.deepcopy(child) for child in para._p] for para in paras]
+            state = self._local.state = (doc, paras, snapshot)
+        return state
+
+    @staticmethod
+    def _restore_paragraphs(paras: list, snapshot: list) -> None:
+        """Reset the slot paragraphs to their template content (keeps the same <w:p> elements)."""
+        for para, children in zip(paras, snapshot):
+            para._p[:] = [copy.deepcopy(child) for child in children]
+
+    def _render_document(self, replacements: dict) -> io.BytesIO:
+        """Fill the labels through python-docx and return the saved .docx."""
+        # Reuse this thread's parsed template; only the slot paragraphs are touched and they are
+        # restored once the document has been serialized
+        doc, paras, snapshot = self._worker_document()
+        buf = io.BytesIO()
+        try:
+            # Try run-preserving per-label replacements (safer for inline images/signatures)
+            for slot, para in zip(self._slots, paras):
+                self._fill_paragraph(para, replacements, slot.keys)
+            doc.save(buf)
+        finally:
+            self._restore_paragraphs(paras, snapshot)
+        return buf
+
+    def _render_xml(self, replacements: dict) -> io.BytesIO:
+        """Fill the labels by substituting their <w:t> elements in document.xml and return the new .docx."""
+        xml = self._doc_xml
+        for key, pattern in self._xml_label_patterns.items():
+            value = b' ' + xml_escape(replacements[key]).encode("utf-8")
+
+            def fill(m):
+                # Same placement as the run-based path: the value goes into the run holding the character
+                # right after the colon. That is the label's own run if blanks follow the colon there,
+                # otherwise the first blank run after it (so it keeps that run's formatting, not the
+                # label's). Remaining blank runs on the line are emptied.
+                label, trailing, blank_runs = m.group(1), m.group(2), m.group(3)
+                blank = self._blank_wt_re.search(blank_runs)
+                if trailing or blank is None:
+                    return (b'<w:t xml:space="preserve">' + label + value + b'</w:t>'
+                            + self._blank_wt_re.sub(b'<w:t></w:t>', blank_runs))
+                return (m.group(0)[:m.start(3) - m.start(0)] + blank_runs[:blank.start()]
+                        + b'<w:t xml:space="preserve">' + value + b'</w:t>'
+                        + self._blank_wt_re.sub(b'<w:t></w:t>', blank_runs[blank.end():]))
+
+            xml = pattern.sub(fill, xml)
+
+        # Unchanged parts are copied as already-compressed bytes; only the new document.xml is deflated,
+        # at the fastest level since it is small and rewritten for every NOC
+        buf = io.BytesIO(self._base_zip)
+        with zipfile.ZipFile(buf, "a") as zo:
+            # writestr() fills size/CRC/offset into the ZipInfo, so give each request its own copy
+            zo.writestr(copy.copy(self._doc_info), xml, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+        return buf
+
+    def _render(self, replacements: dict) -> io.BytesIO:
+        """Return the filled .docx, using the byte-level path whenever the template and values allow it."""
+        # Control characters (line breaks, tabs, ...) need python-docx's run handling or its validation
+        if self._xml_label_patterns is not None and not any(
+            self._control_char_re.search(value) for value in replacements.values()
+        ):
+            return self._render_xml(replacements)
+        return self._render_document(replacements)
+
+    @staticmethod
+    def _write_atomic(output_path: str, buf: io.BytesIO) -> None:
+        """
+        Write the rendered document in a single call to a temporary file and rename it into place,
+        so a partially written NOC is never visible under `output_path`.
+        """
+        out_dir = os.path.dirname(output_path) or "."
+        with tempfile.NamedTemporaryFile("wb", dir=out_dir, suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            try:
+                f.write(buf.getbuffer())
+                # NamedTemporaryFile creates 0600 files; give the NOC the permissions open() would have
+                os.chmod(tmp_path, 0o666 & ~_UMASK)
+            except BaseException:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, output_path)
+
+    def generate_noc(self, full_name: str, job_title: str, department: str, output_dir: Optional[str] = None,
+                     progress: Optional[Callable[[str], None]] = None) -> str:
         """
         Generates and saves a personalized NOC file by replacing placeholders in paragraphs and table cells.
+        The file goes to `output_dir`, or the generator's default_output_dir when omitted.
+        If given, `progress` is called with the name of each stage as it starts.
         Returns the path of the generated file.
         """
-        doc = Document(self.template_path)
-
         replacements = {
             "Full Name": full_name.strip(),
             "Job Title": job_title.strip(),
             "Department": department.strip()
         }
 
-        # First pass: try run-preserving per-label replacements (safer for inline images/signatures)
-        for para in doc.paragraphs:
-            for key, value in replacements.items():
-                if key.lower() in para.text.lower():
-                    replaced = self._replace_field_in_paragraph_runs(para, key, value)
-                    if not replaced:
-                        # fallback: full-text replace (should be rare)
-                        new_text = self._replace_fields_in_text(para.text, {key: value})
-                        para.text = new_text
-
-        # Process inside tables as well
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        for key, value in replacements.items():
-                            if key.lower() in para.text.lower():
-                                replaced = self._replace_field_in_paragraph_runs(para, key, value)
-                                if not replaced:
-                                    new_text = self._replace_fields_in_text(para.text, {key: value})
-                                    para.text = new_text
-
-        # Ensure output directory exists
-        os.makedirs(output_dir, exist_ok=True)
-        safe_name = re.sub(r'[^A-Za-z0-9._-]+', '_', full_name.strip()) or "unknown"
+        # Ensure output directory exists (the default one was created in __init__)
+        if output_dir is None:
+            output_dir = self.default_output_dir
+        if output_dir not in self._ready_dirs:
+            os.makedirs(output_dir, exist_ok=True)
+            self._ready_dirs.add(output_dir)
+        safe_name = self.safe_name(full_name)
         output_path = os.path.join(output_dir, f"NOC_{safe_name}.docx")
 
-        doc.save(output_path)
-        print(f"NOC generated successfully for {full_name}: {output_path}")
+        if progress:
+            progress("filling fields")
+        buf = self._render(replacements)
+        if progress:
+            progress("saving")
+        self._write_atomic(output_path, buf)
+        logger.info("NOC generated for %s -> %s", full_name, output_path)
         return output_path
 
+    def generate_noc_many(self, rows: list, output_dir: Optional[str] = None,
+                          progress: Optional[Callable[[str], None]] = None) -> list:
+        """
+        Generates one NOC per row, where each row is a dict with "full_name", "job_title" and "department".
+        The template is loaded once for the whole batch. If given, `progress` is called after each file.
+        Raises ValueError before generating anything if two rows would write the same file (compared
+        case-insensitively, as on Windows/macOS). Rows are numbered from 1 in error messages.
+        Returns the paths of the generated files, in row order.
+        """
+        first_row = {}
+        for i, row in enumerate(rows, start=1):
+            stem = self.safe_name(row["full_name"])
+            if stem.casefold() in first_row:
+                raise ValueError(f"Rows {first_row[stem.casefold()]} and {i} would both be saved as NOC_{stem}.docx")
+            first_row[stem.casefold()] = i
+
+        paths = []
+        for i, row in enumerate(rows, start=1):
+            paths.append(self.generate_noc(row["full_name"], row["job_title"], row["department"], output_dir))
+            if progress:
+                progress(f"generated {i} of {len(rows)}")
+        return paths
+
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     generator = EmployeeNOCGenerator("NDA-1.docx")
 
     full_name = input("Enter Full Name: ").strip()
@@ -0,0 +1,140 @@
+import io
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    # app.py opens NDA-1.docx and creates generated_noc relative to the working directory at import
+    workdir = tmp_path_factory.mktemp("app")
+    shutil.copy(Path(__file__).with_name("NDA-1.docx"), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+
+@pytest.fixture
+def client(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "OUTPUT_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app_module, "jobs", {})
+    app_module._invalidate_results_cache()
+    return app_module.app.test_client()
+
+
+def post_csv(client, text):
+    data = {"csv_file": (io.BytesIO(text.encode("utf-8")), "employees.csv")}
+    return client.post("/generate_batch", data=data, content_type="multipart/form-data")
+
+
+def test_batch_rejects_names_differing_only_in_case(client, tmp_path):
+    resp = post_csv(client, "Full Name,Job Title,Department\nArjun_K,Engineer,IT\nARJUN_K,Engineer,IT\n")
+    assert resp.status_code == 400
+    assert resp.get_json()["error"].startswith("Rows 1 and 2 would both be saved as")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_batch_rejects_too_many_rows(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH_ROWS", 2)
+    resp = post_csv(client, "Full Name,Job Title,Department\n" + "".join(f"E{i},Engineer,IT\n" for i in range(3)))
+    assert resp.status_code == 400
+    assert "more than 2 rows" in resp.get_json()["error"]
+
+
+def test_oversized_upload_gets_a_json_error(client, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "MAX_CONTENT_LENGTH", 64)
+    resp = post_csv(client, "Full Name,Job Title,Department\n" + "Arjun,Engineer,IT\n" * 10)
+    assert resp.status_code == 413
+    assert "error" in resp.get_json()
+
+
+def events(resp):
+    """The JSON payloads of a finished /progress response, in order."""
+    return [json.loads(line[len("data: "):]) for line in resp.get_data(as_text=True).splitlines()
+            if line.startswith("data: ")]
+
+
+def run_job(client, **form):
+    resp = client.post("/generate", data=dict(full_name="Arjun Kumar", job_title="Engineer", department="IT", **form))
+    assert resp.status_code == 202
+    return events(client.get(resp.get_json()["progress_url"]))
+
+
+def test_generate_accepts_valid_form(client, app_module):
+    resp = client.post("/generate", data=dict(full_name="Arjun Kumar", job_title="Engineer", department="IT"))
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert body["job_id"] in app_module.jobs
+    assert body["progress_url"] == f"/progress/{body['job_id']}"
+    client.get(body["progress_url"]).get_data()
+
+
+@pytest.mark.parametrize("form", [
+    dict(full_name="", job_title="Engineer", department="IT"),
+    dict(full_name="x" * 101, job_title="Engineer", department="IT"),
+])
+def test_generate_rejects_invalid_form(client, app_module, form):
+    resp = client.post("/generate", data=form)
+    assert resp.status_code == 400
+    assert "error" in resp.get_json()
+    assert app_module.jobs == {}
+
+
+def test_progress_streams_stages_then_drops_the_job(client, app_module, tmp_path):
+    stream = run_job(client)
+    assert [e["stage"] for e in stream] == ["filling fields", "saving", "done"]
+    done = stream[-1]
+    assert done["download_url"] == f"/download/{done['filename']}" and done["results_url"] == "/results"
+    assert (tmp_path / done["filename"]).is_file()
+    assert app_module.jobs == {}
+
+
+def test_progress_of_unknown_job_is_404(client):
+    assert client.get("/progress/nope").status_code == 404
+
+
+def test_disconnect_drops_the_job(client, app_module):
+    job_id = app_module._submit_job(lambda job: job.put({"stage": "working"}))
+    resp = client.get(f"/progress/{job_id}", buffered=False)
+    assert json.loads(next(iter(resp.response))[len(b"data: "):]) == {"stage": "working"}
+    assert job_id in app_module.jobs
+    resp.close()
+    assert job_id not in app_module.jobs
+
+
+def test_uncollected_finished_jobs_expire(client, app_module):
+    stale, running = app_module._Job(), app_module._Job()
+    stale.finish({"stage": "done"})
+    stale.finished_at -= app_module.JOB_TTL + 1
+    app_module.jobs.update(stale=stale, running=running)
+    app_module._submit_job(lambda job: None)
+    assert "stale" not in app_module.jobs and "running" in app_module.jobs
+
+
+def test_results_cache_is_rebuilt_after_a_job(client, tmp_path):
+    assert client.get("/results").status_code == 200
+    cached_mtime = os.stat(tmp_path).st_mtime_ns
+    (tmp_path / "NOC_outside.docx").write_bytes(b"x")
+    os.utime(tmp_path, ns=(cached_mtime, cached_mtime))
+    assert b"NOC_outside.docx" not in client.get("/results").data  # folder unchanged as far as the cache knows
+
+    filename = run_job(client)[-1]["filename"]
+    os.utime(tmp_path, ns=(cached_mtime, cached_mtime))
+    page = client.get("/results").data
+    assert b"NOC_outside.docx" in page and filename.encode() in page
+
+
+def test_download_revalidates_with_etag(client, tmp_path):
+    (tmp_path / "NOC_A.docx").write_bytes(b"docx bytes")
+    resp = client.get("/download/NOC_A.docx")
+    assert resp.status_code == 200 and resp.data == b"docx bytes"
+    etag = resp.headers["ETag"]
+    assert client.get("/download/NOC_A.docx", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/download/NOC_B.docx").status_code == 404
@@ -0,0 +1,173 @@
+import io
+from pathlib import Path
+
+import pytest
+from docx import Document
+
+from noc_generator import EmployeeNOCGenerator
+
+NDA_TEMPLATE = str(Path(__file__).with_name("NDA-1.docx"))
+
+VALUES = {"Full Name": "Arjun Kumar", "Job Title": "Engineer", "Department": "R&D <Ops>"}
+
+
+def make_template(tmp_path, build, name="template.docx"):
+    """Save a python-docx document built by `build(doc)` and return its path."""
+    doc = Document()
+    build(doc)
+    path = tmp_path / name
+    doc.save(path)
+    return str(path)
+
+
+def add_runs(doc, *texts):
+    para = doc.add_paragraph()
+    for text in texts:
+        para.add_run(text)
+    return para
+
+
+def texts(buf: io.BytesIO) -> list:
+    """All paragraph and table cell texts of a rendered .docx, in document order."""
+    doc = Document(buf)
+    result = [p.text for p in doc.paragraphs]
+    for table in doc.tables:
+        for row in table.rows:
+            result.extend(cell.text for cell in row.cells)
+    return result
+
+
+@pytest.fixture
+def generator_for(tmp_path):
+    def _make(build):
+        return EmployeeNOCGenerator(make_template(tmp_path, build), default_output_dir=str(tmp_path / "out"))
+    return _make
+
+
+def test_label_split_across_runs(generator_for):
+    gen = generator_for(lambda doc: add_runs(doc, "Ful", "l Name", ":  old", "er", "\nJob Title:"))
+    para = texts(gen._render_document(VALUES))[0]
+    assert para == "Full Name: Arjun Kumar\nJob Title: Engineer"
+
+
+def test_only_runs_on_the_label_line_change(generator_for):
+    gen = generator_for(lambda doc: add_runs(doc, "Intro ", "Full Name:", " ", "\nTail"))
+    doc = Document(gen._render_document(VALUES))
+    assert [r.text for r in doc.paragraphs[0].runs] == ["Intro ", "Full Name:", " Arjun Kumar", "\nTail"]
+
+
+def test_labels_in_table_cells(generator_for):
+    def build(doc):
+        table = doc.add_table(rows=2, cols=2)
+        table.cell(0, 0).text = "Full Name:"
+        table.cell(1, 0).merge(table.cell(1, 1))
+        table.cell(1, 0).text = "Job Title: \nDepartment:"
+
+    gen = generator_for(build)
+    assert {slot.kind for slot in gen._slots} == {"table"}
+    cells = texts(gen._render_document(VALUES))
+    assert "Full Name: Arjun Kumar" in cells
+    assert "Job Title: Engineer\nDepartment: R&D <Ops>" in cells
+
+
+def test_label_after_a_neighbouring_cell_is_found(generator_for):
+    # cell texts must not run together ("EmployeeDepartment:") when deciding whether a table has labels
+    def build(doc):
+        row = doc.add_table(rows=1, cols=2).rows[0]
+        row.cells[0].text = "Employee"
+        row.cells[1].text = "Department: TBD"
+
+    gen = generator_for(build)
+    assert [slot.path for slot in gen._slots] == [(0, 0, 1, 0)]
+    assert texts(gen._render(VALUES))[-1] == "Department: R&D <Ops>"
+
+
+def test_paragraph_without_colon_is_untouched(generator_for):
+    gen = generator_for(lambda doc: (add_runs(doc, "The Department will review."), add_runs(doc, "Department:")))
+    assert texts(gen._render_document(VALUES)) == ["The Department will review.", "Department: R&D <Ops>"]
+
+
+@pytest.mark.parametrize("build", [
+    pytest.param(lambda doc: add_runs(doc, "Full ", "Name:"), id="label-split-across-runs"),
+    pytest.param(lambda doc: add_runs(doc, "Full Name: ________"), id="value-not-blank"),
+    pytest.param(lambda doc: add_runs(doc, "Full Name:", "\n", "Full Name:"), id="label-twice-in-paragraph"),
+])
+def test_fast_path_rejects_template(generator_for, build):
+    gen = generator_for(build)
+    assert gen._xml_label_patterns is None
+
+
+@pytest.mark.parametrize("build", [
+    pytest.param(lambda doc: add_runs(doc, "Full Name:", " ", "\nJob Title: ", "\nDepartment:", " "), id="form"),
+    pytest.param(lambda doc: (add_runs(doc, "Intro"), doc.add_table(rows=1, cols=1).cell(0, 0).paragraphs[0]
+                              .add_run("Department:")), id="table"),
+])
+def test_fast_path_matches_run_based_path(generator_for, build):
+    gen = generator_for(build)
+    assert gen._xml_label_patterns is not None
+    assert texts(gen._render_xml(VALUES)) == texts(gen._render_document(VALUES))
+    fast, slow = Document(gen._render_xml(VALUES)), Document(gen._render_document(VALUES))
+    assert [[r.text for r in p.runs] for p in fast.paragraphs] == [[r.text for r in p.runs] for p in slow.paragraphs]
+
+
+def test_fast_path_keeps_value_out_of_bold_label_run(generator_for):
+    def build(doc):
+        para = doc.add_paragraph()
+        para.add_run("Full Name:").bold = True
+        para.add_run(" ")
+
+    gen = generator_for(build)
+    assert gen._xml_label_patterns is not None
+    runs = Document(gen._render_xml(VALUES)).paragraphs[0].runs
+    assert [(r.text, r.bold) for r in runs] == [("Full Name:", True), (" Arjun Kumar", None)]
+
+
+def test_fast_path_rejects_template_whose_runs_would_differ(generator_for):
+    # the run-based path puts the value into the "\nTail" run, which the XML path can't reproduce
+    gen = generator_for(lambda doc: add_runs(doc, "Full Name:", "\nTail"))
+    assert gen._xml_label_patterns is None
+    assert texts(gen._render(VALUES)) == ["Full Name: Arjun Kumar\nTail"]
+
+
+def test_fast_path_matches_run_based_path_on_shipped_template(tmp_path):
+    gen = EmployeeNOCGenerator(NDA_TEMPLATE, default_output_dir=str(tmp_path))
+    assert gen._xml_label_patterns is not None
+    fast = texts(gen._render_xml(VALUES))
+    assert fast == texts(gen._render_document(VALUES))
+    assert "Full Name: Arjun Kumar\nJob Title: Engineer\nDepartment: R&D <Ops>" in fast
+
+
+def test_value_with_tab_reads_like_plain_value(tmp_path):
+    # a tab sends the value through python-docx; the line must end the same way as on the fast path
+    gen = EmployeeNOCGenerator(NDA_TEMPLATE, default_output_dir=str(tmp_path))
+    plain = texts(gen._render(VALUES))
+    tabbed = texts(gen._render(dict(VALUES, Department="R&D\t<Ops>")))
+    assert "Full Name: Arjun Kumar\nJob Title: Engineer\nDepartment: R&D <Ops>" in plain
+    assert "Full Name: Arjun Kumar\nJob Title: Engineer\nDepartment: R&D\t<Ops>" in tabbed
+
+
+def test_safe_name_keeps_non_ascii_names_usable(tmp_path):
+    gen = EmployeeNOCGenerator(NDA_TEMPLATE, default_output_dir=str(tmp_path))
+    assert gen.safe_name("Arjun_Kumar") == "Arjun_Kumar"
+    assert gen.safe_name("李雷") == "李雷"
+    assert gen.safe_name("Jöse") != gen.safe_name("Jäse")
+    assert gen.safe_name(" Arjun Kumar ").startswith("Arjun_Kumar_")
+    assert "/" not in gen.safe_name("../../etc/passwd")
+
+
+@pytest.mark.parametrize("first, second", [
+    ("A B", "A_B"),
+    ("李雷 A", "王芳 A"),
+    ("राम कुमार", "रोम कुमार"),
+])
+def test_safe_name_does_not_merge_distinct_names(tmp_path, first, second):
+    gen = EmployeeNOCGenerator(NDA_TEMPLATE, default_output_dir=str(tmp_path))
+    assert gen.safe_name(first) == gen.safe_name(first) != gen.safe_name(second)
+
+
+def test_batch_rejects_rows_that_share_a_file(tmp_path):
+    gen = EmployeeNOCGenerator(NDA_TEMPLATE, default_output_dir=str(tmp_path))
+    rows = [dict(full_name=name, job_title="Engineer", department="IT") for name in ("Arjun_K", "ARJUN_K")]
+    with pytest.raises(ValueError, match="Rows 1 and 2 .* NOC_ARJUN_K.docx"):
+        gen.generate_noc_many(rows)
+    assert list(tmp_path.iterdir()) == []